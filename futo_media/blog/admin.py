@@ -12,14 +12,22 @@ class ReplyInline(admin.TabularInline):
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ("title", "author", "created_at")
+    list_display = ("title", "author", "created_at", "likes_count", "comments_count")
+    list_select_related = ("author",)
     prepopulated_fields = {"slug": ("title",)}
-    search_fields = ("title", "subtitle", "content")
+    # content is a TEXT column; searching it forces a full table scan
+    search_fields = ("title", "subtitle")
+    show_full_result_count = False
     list_filter = ("created_at",)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counts().select_related("author")
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "post", "parent", "created_at", "is_active")
+    list_select_related = ("post", "parent")
+    raw_id_fields = ("post", "parent")
     list_filter = ("is_active", "created_at")
     search_fields = ("name", "content")
     readonly_fields = ("created_at",)
@@ -28,4 +36,6 @@ class CommentAdmin(admin.ModelAdmin):
 @admin.register(Like)
 class LikeAdmin(admin.ModelAdmin):
     list_display = ("post", "visitor_id", "created_at")
+    list_select_related = ("post",)
+    raw_id_fields = ("post",)
     readonly_fields = ("created_at",)
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        # models already import the SDK for CloudinaryField; apply the credentials
+        # before the first upload or image URL is built
+        if settings.USE_CLOUDINARY:
+            from futo_media.storages import configure_cloudinary
+
+            configure_cloudinary()
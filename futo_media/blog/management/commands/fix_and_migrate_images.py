@@ -1,9 +1,186 @@
+import itertools
 import os
+import re
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from blog.models import Post
+from django.db import transaction
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast, Substr
+from blog.models import Post, canonical_image_url
+import cloudinary
 import cloudinary.uploader
+import cloudinary.utils
+
+# Uploads are dominated by HTTPS round-trips, so run them in parallel
+MAX_WORKERS = 16
+# Posts streamed from the DB (and written back) per batch
+CHUNK_SIZE = 200
+
+_ABS_RE = re.compile(r'^https?://')
+_CLOUDINARY_PREFIXES = ('https://res.cloudinary.com/', 'http://res.cloudinary.com/')
+# absolute URL hidden behind accidental leading slashes and/or a 'media/' prefix
+_MEDIA_STRIP_RE = re.compile(r'^/*(?:media/)?(https?://.+)$')
+
+
+def _decode_embedded_url(value):
+    """
+    Recovers an absolute URL stored encoded and/or behind a /media/ prefix,
+    e.g. '/media/https%3A//res.cloudinary.com/...' -> 'https://res.cloudinary.com/...'.
+    Returns None when no absolute URL can be recovered.
+    """
+    # unquote until nothing changes; each pass that decodes something shrinks the string
+    while '%' in value:
+        decoded = urllib.parse.unquote(value)
+        if len(decoded) >= len(value):
+            break
+        value = decoded
+    m = _MEDIA_STRIP_RE.match(value)
+    return m.group(1) if m else None
+
+
+def _share_upload_pool(size):
+    """
+    cloudinary.uploader sends every upload through one module-level urllib3 pool
+    manager that keeps a single connection per host. Replace it with one sized for
+    `size` concurrent workers so their uploads reuse keep-alive TLS connections
+    instead of opening (and discarding) a new one per upload.
+    """
+    cloudinary.uploader._http = cloudinary.utils.get_http_connector(
+        cloudinary.config(), dict(cloudinary.CERT_KWARGS, maxsize=size)
+    )
+
+
+def _upload(local_path):
+    """
+    Uploads a local file to Cloudinary folder 'futo_media/posts'.
+    Returns ("migrated", secure_url) on success, ("skipped", reason) when the
+    file does not exist or ("error", message) on failure.
+    """
+    # open directly instead of a separate exists() check; we need the handle anyway
+    try:
+        fh = open(local_path, 'rb')
+    except FileNotFoundError:
+        return "skipped", f"Local file not found at {local_path}, skipping"
+    try:
+        with fh:
+            res = cloudinary.uploader.upload(fh, folder="futo_media/posts")
+    except Exception as e:
+        return "error", f"Upload exception: {e}"
+    secure = res.get("secure_url")
+    if not secure:
+        return "error", f"Upload returned no secure_url: {res}"
+    return "migrated", secure
+
+
+def process_post(post, log):
+    """
+    Works out what the image value of `post` should become, without touching the DB.
+    Returns (action, value) where action is one of:
+    - "fixed" / "migrated": value is the new image value to store
+    - "noop" / "skipped": value is the reason
+    - "error": value is the error message
+    """
+    # get name and url safely
+    name = getattr(post.image, 'name', '') or ''
+    try:
+        url = getattr(post.image, 'url', '') or ''
+    except Exception:
+        url = ''
+
+    log(f"Post {post.pk}: name='{name}' url='{url[:120]}'")
+
+    # 1) If url already absolute Cloudinary -> ensure stored as that url
+    if url.startswith(_CLOUDINARY_PREFIXES):
+        # stored as proper Cloudinary URL, make sure image field equals url
+        if name != url:
+            return "fixed", url
+        return "noop", "Already Cloudinary, nothing to do"
+
+    # 2) If url contains encoded cloudinary e.g. 'https%3A' or '/media/https%3A' -> decode
+    if 'https%3A' in url or 'http%253A' in url or '/media/https:' in url or '/media/http:' in url:
+        decoded = _decode_embedded_url(url)
+        if decoded:
+            return "migrated", decoded
+        # otherwise keep going to next checks
+
+    # 3) If url starts with http but not Cloudinary (likely localhost media)
+    if _ABS_RE.match(url):
+        # Try to detect local media path and upload the file
+        # look for '/media/' in the URL
+        idx = url.find('/media/')
+        if idx == -1:
+            # URL is external but not cloudinary and no /media seg -> skip
+            return "skipped", "External non-cloudinary URL, skipping"
+        rel = url[idx + len('/media/'):]  # e.g. post_images/...
+        local_path = os.path.join(settings.MEDIA_ROOT, rel)
+        log(f" -> Post {post.pk}: uploading local file {local_path} to Cloudinary...")
+        return _upload(local_path)
+
+    # 4) If url is empty but name present (relative path stored) -> upload file
+    if name:
+        # If name is already an absolute http stored in name (rare) decode
+        if _ABS_RE.match(name):
+            if name.startswith(_CLOUDINARY_PREFIXES):
+                return "fixed", name
+            # name is some other absolute path; try to extract local file after /media/
+            idx = name.find('/media/')
+            if idx != -1:
+                rel = name[idx + len('/media/'):]
+                local_path = os.path.join(settings.MEDIA_ROOT, rel)
+            else:
+                local_path = os.path.join(settings.MEDIA_ROOT, name)
+        else:
+            local_path = os.path.join(settings.MEDIA_ROOT, name)
+
+        log(f" -> Post {post.pk}: uploading local file {local_path} to Cloudinary...")
+        return _upload(local_path)
+
+    # 5) Nothing we can do
+    return "skipped", "Nothing to do (no name/url usable)"
+
+
+def bulk_decode_stored_values():
+    """
+    Repairs stored image values that need no upload before the per-post pass:
+    a plain '/media/' prefix in front of an absolute URL is stripped in one UPDATE,
+    and URL-encoded values are decoded with _decode_embedded_url.
+    Refreshes image_url for the repaired rows and returns how many there were.
+    Values that can't be decoded are left untouched for process_post.
+    """
+    # encoded values need a full decode, which a SQL replace can't do
+    prefixed = Post.objects.filter(image__startswith='/media/http').exclude(image__contains='%')
+    prefixed_pks = list(prefixed.values_list('pk', flat=True))
+
+    # read the raw column; the field would parse it as a Cloudinary public_id
+    encoded = (
+        Post.objects.filter(Q(image__contains='%3A') | Q(image__contains='%253A'))
+        .exclude(image__startswith='https://')
+        .exclude(image__startswith='http://')
+        .annotate(raw=Cast('image', CharField()))
+        .values_list('pk', 'raw')
+    )
+    decoded = []
+    for pk, raw in encoded:
+        url = _decode_embedded_url(raw)
+        if url:
+            decoded.append(Post(pk=pk, image=url, image_url=canonical_image_url(url)))
+
+    if not prefixed_pks and not decoded:
+        return 0
+
+    with transaction.atomic():
+        Post.objects.filter(pk__in=prefixed_pks).update(image=Substr('image', len('/media/') + 1))
+        # image_url is derived in Python, recompute it for the rows just rewritten
+        posts = list(Post.objects.filter(pk__in=prefixed_pks).only('id', 'image'))
+        for post in posts:
+            post.image_url = canonical_image_url(post.image)
+        Post.objects.bulk_update(posts, ['image_url'], batch_size=CHUNK_SIZE)
+        Post.objects.bulk_update(decoded, ['image', 'image_url'], batch_size=CHUNK_SIZE)
+    return len(posts) + len(decoded)
+
 
 class Command(BaseCommand):
     help = "Fix improperly stored image URLs and upload local media to Cloudinary"
@@ -14,130 +191,58 @@ class Command(BaseCommand):
         skipped = 0
         errors = 0
 
-        for post in Post.objects.all():
+        # workers log progress concurrently, serialize writes to stdout
+        lock = threading.Lock()
+
+        def log(msg, style=None):
+            with lock:
+                self.stdout.write(style(msg) if style else msg)
+
+        def safe_process(post):
             try:
-                # get name and url safely
-                name = getattr(post.image, 'name', '') or ''
-                try:
-                    url = getattr(post.image, 'url', '') or ''
-                except Exception:
-                    url = ''
-
-                self.stdout.write(f"Post {post.pk}: name='{name}' url='{url[:120]}'")
-
-                # 1) If url already absolute Cloudinary -> ensure stored as that url
-                if url.startswith(('http://', 'https://')) and 'res.cloudinary.com' in url:
-                    # stored as proper Cloudinary URL, make sure image field equals url
-                    if name != url:
-                        post.image = url
-                        post.save(update_fields=['image'])
-                        fixed += 1
-                        self.stdout.write(self.style.SUCCESS(f" -> Fixed stored value to Cloudinary URL"))
-                    else:
-                        self.stdout.write(" -> Already Cloudinary, nothing to do")
-                    continue
-
-                # 2) If url contains encoded cloudinary e.g. 'https%3A' or '/media/https%3A' -> decode
-                if 'https%3A' in url or 'http%253A' in url or '/media/https:' in url or '/media/http:' in url:
-                    decoded = urllib.parse.unquote(url)
-                    # remove accidental /media/ prefix(s)
-                    # e.g. '/media/https://res.cloudinary.com/...' -> 'https://res.cloudinary.com/...'
-                    decoded = decoded.lstrip('/')
-                    if decoded.startswith('media/'):
-                        decoded = decoded[len('media/'):]
-                    # also remove any repeated 'media/http...' variants
-                    if decoded.startswith('http://') or decoded.startswith('https://'):
-                        post.image = decoded
-                        post.save(update_fields=['image'])
-                        migrated += 1
-                        self.stdout.write(self.style.SUCCESS(f" -> Decoded & fixed to {decoded[:80]}"))
-                        continue
-                    # otherwise keep going to next checks
-
-                # 3) If url starts with http but not Cloudinary (likely localhost media)
-                if url.startswith(('http://', 'https://')):
-                    # Try to detect local media path and upload the file
-                    # look for '/media/' in the URL
-                    idx = url.find('/media/')
-                    if idx != -1:
-                        rel = url[idx + len('/media/'):]  # e.g. post_images/...
-                        local_path = os.path.join(settings.MEDIA_ROOT, rel)
-                        if os.path.exists(local_path):
-                            self.stdout.write(f" -> Found local file {local_path}, uploading to Cloudinary...")
-                            res = cloudinary.uploader.upload(local_path, folder="futo_media/posts")
-                            secure = res.get("secure_url")
-                            if secure:
-                                post.image = secure
-                                post.save(update_fields=['image'])
-                                migrated += 1
-                                self.stdout.write(self.style.SUCCESS(f" -> Uploaded & set {secure[:80]}"))
-                                continue
-                            else:
-                                errors += 1
-                                self.stdout.write(self.style.ERROR(f" -> Upload returned no secure_url: {res}"))
-                                continue
-                        else:
-                            # no local file found, but url is not Cloudinary: skip
-                            skipped += 1
-                            self.stdout.write(self.style.WARNING(f" -> Local file not found for URL, skipping"))
-                            continue
-                    else:
-                        # URL is external but not cloudinary and no /media seg -> skip
-                        skipped += 1
-                        self.stdout.write(self.style.WARNING(" -> External non-cloudinary URL, skipping"))
-                        continue
-
-                # 4) If url is empty but name present (relative path stored) -> upload file
-                if name:
-                    # If name is already an absolute http stored in name (rare) decode
-                    if name.startswith('http://') or name.startswith('https://'):
-                        if 'res.cloudinary.com' in name:
-                            post.image = name
-                            post.save(update_fields=['image'])
+                return process_post(post, log)
+            except Exception as e:
+                return "error", f"unexpected error: {e}"
+
+        decoded = bulk_decode_stored_values()
+        if decoded:
+            migrated += decoded
+            log(f"Decoded {decoded} stored image value(s) in bulk", self.style.SUCCESS)
+
+        _share_upload_pool(MAX_WORKERS)
+
+        # stream posts (without the large content column) so memory stays flat
+        rows = Post.objects.only('id', 'image').iterator(chunk_size=CHUNK_SIZE)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            while True:
+                posts = list(itertools.islice(rows, CHUNK_SIZE))
+                if not posts:
+                    break
+                changed = []
+                for post, (action, value) in zip(posts, pool.map(safe_process, posts)):
+                    if action in ("fixed", "migrated"):
+                        post.image = value
+                        post.image_url = canonical_image_url(value)
+                        changed.append(post)
+                        if action == "fixed":
                             fixed += 1
-                            self.stdout.write(self.style.SUCCESS(" -> Name was Cloudinary URL, fixed"))
-                            continue
+                            log(f"Post {post.pk}: -> Fixed stored value to {value[:80]}", self.style.SUCCESS)
                         else:
-                            # name is some other absolute path; try to extract local file after /media/
-                            idx = name.find('/media/')
-                            if idx != -1:
-                                rel = name[idx + len('/media/'):]
-                                local_path = os.path.join(settings.MEDIA_ROOT, rel)
-                            else:
-                                local_path = os.path.join(settings.MEDIA_ROOT, name)
-                    else:
-                        local_path = os.path.join(settings.MEDIA_ROOT, name)
-
-                    if os.path.exists(local_path):
-                        self.stdout.write(f" -> Uploading local file {local_path} to Cloudinary...")
-                        try:
-                            res = cloudinary.uploader.upload(local_path, folder="futo_media/posts")
-                            secure = res.get("secure_url")
-                            if secure:
-                                post.image = secure
-                                post.save(update_fields=['image'])
-                                migrated += 1
-                                self.stdout.write(self.style.SUCCESS(f" -> Uploaded & set {secure[:80]}"))
-                                continue
-                            else:
-                                errors += 1
-                                self.stdout.write(self.style.ERROR(f" -> Upload failed, no secure_url returned: {res}"))
-                                continue
-                        except Exception as e:
-                            errors += 1
-                            self.stdout.write(self.style.ERROR(f" -> Upload exception: {e}"))
-                            continue
-                    else:
+                            migrated += 1
+                            log(f"Post {post.pk}: -> Migrated & set {value[:80]}", self.style.SUCCESS)
+                    elif action == "skipped":
                         skipped += 1
-                        self.stdout.write(self.style.WARNING(f" -> Local file not found at {local_path}, skipping"))
-                        continue
-
-                # 5) Nothing we can do
-                skipped += 1
-                self.stdout.write(" -> Nothing to do (no name/url usable)")
+                        log(f"Post {post.pk}: -> {value}", self.style.WARNING)
+                    elif action == "error":
+                        errors += 1
+                        log(f"Post {post.pk}: -> {value}", self.style.ERROR)
+                    else:
+                        log(f"Post {post.pk}: -> {value}")
 
-            except Exception as e:
-                errors += 1
-                self.stdout.write(self.style.ERROR(f"Post {post.pk}: unexpected error: {e}"))
+                # apply the batch's writes on the main thread in a single transaction
+                if changed:
+                    with transaction.atomic():
+                        Post.objects.bulk_update(changed, ['image', 'image_url'])
 
         self.stdout.write(self.style.SUCCESS(f"Done: migrated={migrated}, fixed={fixed}, skipped={skipped}, errors={errors}"))
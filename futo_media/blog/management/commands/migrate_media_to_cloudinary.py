@@ -2,10 +2,17 @@
 import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from blog.models import Post
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Cast
+from blog.models import Post, canonical_image_url
 import cloudinary
 import cloudinary.uploader
 
+# Number of updated posts written per UPDATE round-trip
+BATCH_SIZE = 500
+
+
 class Command(BaseCommand):
     help = "Upload local / old post images to Cloudinary (folder futo_media/posts) and update Post.image to point to Cloudinary public_id."
 
@@ -14,47 +21,63 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR("Cloudinary credentials not configured in settings. Aborting."))
             return
 
-        posts = Post.objects.all()
-        total = posts.count()
+        total = Post.objects.count()
         self.stdout.write(f"Found {total} posts. Processing...")
 
-        for p in posts:
-            img_field = getattr(p, "image", None)
-            name = None
-            try:
-                name = getattr(img_field, "name", None)
-            except Exception:
-                name = None
+        pending = []
 
+        def flush():
+            # one UPDATE ... SET image = CASE WHEN id = ... for the whole batch
+            with transaction.atomic():
+                Post.objects.filter(pk__in=[pk for pk, _, _ in pending]).update(
+                    image=Case(*[When(pk=pk, then=Value(public_id)) for pk, public_id, _ in pending]),
+                    image_url=Case(*[When(pk=pk, then=Value(url)) for pk, _, url in pending]),
+                )
+            pending.clear()
+
+        # read (pk, stored image string) rows; no Post instances are built
+        rows = (
+            Post.objects.annotate(image_name=Cast("image", output_field=CharField()))
+            .values_list("pk", "image_name")
+            .iterator(chunk_size=BATCH_SIZE)
+        )
+        for pk, name in rows:
             # Skip if already looks like a Cloudinary public_id or already uploaded (public_id rarely contains '/media' or '/post_images')
             if not name:
-                self.stdout.write(f"- Post {p.pk}: no image, skipping.")
+                self.stdout.write(f"- Post {pk}: no image, skipping.")
                 continue
 
             # If name looks like an absolute url to Cloudinary, skip
-            if name.startswith("http://") or name.startswith("https://") or name.startswith("futo_media/") or "res.cloudinary.com" in str(name):
-                self.stdout.write(f"- Post {p.pk}: already absolute or cloud path ({name}), skipping.")
+            if name.startswith(("http://", "https://", "futo_media/")) or "res.cloudinary.com" in name:
+                self.stdout.write(f"- Post {pk}: already absolute or cloud path ({name}), skipping.")
                 continue
 
             # Construct local path
             local_path = os.path.join(settings.MEDIA_ROOT, name) if not os.path.isabs(name) else name
-            if not os.path.exists(local_path):
-                self.stdout.write(self.style.WARNING(f"- Post {p.pk}: local file not found at {local_path}. Skipping."))
+            try:
+                fh = open(local_path, "rb")
+            except FileNotFoundError:
+                self.stdout.write(self.style.WARNING(f"- Post {pk}: local file not found at {local_path}. Skipping."))
                 continue
 
             # Upload to Cloudinary
             try:
-                result = cloudinary.uploader.upload(local_path, folder="futo_media/posts", resource_type="image", use_filename=True, unique_filename=True)
+                with fh:
+                    result = cloudinary.uploader.upload(fh, folder="futo_media/posts", resource_type="image", use_filename=True, unique_filename=True)
                 public_id = result.get("public_id")
                 secure_url = result.get("secure_url")
                 if public_id:
                     # set the CloudinaryField value to public_id (CloudinaryField will resolve .url)
-                    p.image = public_id
-                    p.save(update_fields=["image"])
-                    self.stdout.write(self.style.SUCCESS(f"- Post {p.pk}: uploaded -> {secure_url}"))
+                    pending.append((pk, public_id, canonical_image_url(public_id)))
+                    if len(pending) >= BATCH_SIZE:
+                        flush()
+                    self.stdout.write(self.style.SUCCESS(f"- Post {pk}: uploaded -> {secure_url}"))
                 else:
-                    self.stdout.write(self.style.ERROR(f"- Post {p.pk}: upload returned no public_id: {result}"))
+                    self.stdout.write(self.style.ERROR(f"- Post {pk}: upload returned no public_id: {result}"))
             except Exception as exc:
-                self.stdout.write(self.style.ERROR(f"- Post {p.pk}: upload failed: {exc}"))
+                self.stdout.write(self.style.ERROR(f"- Post {pk}: upload failed: {exc}"))
+
+        if pending:
+            flush()
 
         self.stdout.write(self.style.SUCCESS("Done."))
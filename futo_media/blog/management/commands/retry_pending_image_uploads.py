@@ -0,0 +1,50 @@
+# blog/management/commands/retry_pending_image_uploads.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.models import IMAGE_FAILED, IMAGE_PENDING, Post
+from blog.tasks import attach_remote_image, cloudinary_configured
+
+# A background upload still pending after this long was lost (e.g. the worker was killed)
+STALE_AFTER_MINUTES = 15
+
+
+class Command(BaseCommand):
+    help = (
+        "Retry background image_url uploads that never finished: posts left 'pending' for longer "
+        "than --older-than minutes are uploaded again from their stored image_source_url."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=STALE_AFTER_MINUTES, help="Minutes a post must have been pending.")
+        parser.add_argument("--include-failed", action="store_true", help="Also retry posts whose upload failed.")
+        parser.add_argument("--mark-failed", action="store_true", help="Mark stale posts failed instead of retrying.")
+
+    def handle(self, *args, **options):
+        statuses = [IMAGE_PENDING, IMAGE_FAILED] if options["include_failed"] else [IMAGE_PENDING]
+        cutoff = timezone.now() - timedelta(minutes=options["older_than"])
+        stale = Post.objects.filter(image_status__in=statuses, updated_at__lt=cutoff)
+
+        if options["mark_failed"]:
+            marked = stale.filter(image_status=IMAGE_PENDING).update(image_status=IMAGE_FAILED)
+            self.stdout.write(self.style.SUCCESS(f"Marked {marked} stale upload(s) failed."))
+            return
+
+        if not cloudinary_configured():
+            self.stdout.write(self.style.ERROR("Cloudinary credentials not configured in settings. Aborting."))
+            return
+
+        attached = failed = 0
+        for pk, url in stale.values_list("pk", "image_source_url"):
+            # rows left pending before the source URL was stored can't be retried
+            if url and attach_remote_image(pk, url):
+                attached += 1
+                self.stdout.write(self.style.SUCCESS(f"- Post {pk}: attached {url}"))
+            else:
+                Post.objects.filter(pk=pk).update(image_status=IMAGE_FAILED)
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"- Post {pk}: upload failed ({url or 'no source URL'})"))
+
+        self.stdout.write(self.style.SUCCESS(f"Done: attached={attached}, failed={failed}"))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-15 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_comment_parent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'is_active', 'created_at'], name='comment_tree_idx'),
+        ),
+    ]
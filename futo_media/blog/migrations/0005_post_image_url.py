@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-15 02:56
+
+import blog.models
+import cloudinary
+from cloudinary.models import CloudinaryField
+from django.db import migrations
+
+
+def _image_url(stored):
+    """
+    Copy of blog.models.canonical_image_url frozen for this migration, for a raw
+    stored image value. Absolute URLs are kept as they are; public_ids need the
+    Cloudinary credentials to build a URL, so without them None is returned and
+    the row is left for fix_and_migrate_images (or the next save) to fill in.
+    """
+    if stored.startswith(('https://', 'http://')):
+        return stored
+    if not cloudinary.config().cloud_name:
+        return None
+    try:
+        return CloudinaryField('image').to_python(stored).url or ''
+    except Exception:
+        return ''
+
+
+def backfill_image_url(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    posts = []
+    # raw column values: in this migration's state image is still an ImageField
+    rows = Post.objects.exclude(image__isnull=True).exclude(image='').values_list('pk', 'image')
+    for pk, stored in rows:
+        url = _image_url(stored)
+        if url is not None:
+            posts.append(Post(pk=pk, image_url=url))
+    Post.objects.bulk_update(posts, ['image_url'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_comment_tree_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_url',
+            field=blog.models.ImageURLField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_image_url, migrations.RunPython.noop),
+    ]
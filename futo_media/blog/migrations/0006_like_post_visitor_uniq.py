@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-15 02:57
+
+import hashlib
+
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def shorten_visitor_ids(apps, schema_editor):
+    # visitor ids longer than 64 chars are replaced by their sha256 hex digest
+    Like = apps.get_model('blog', 'Like')
+    for like in Like.objects.annotate(id_len=Length('visitor_id')).filter(id_len__gt=64):
+        like.visitor_id = hashlib.sha256(like.visitor_id.encode()).hexdigest()
+        if Like.objects.filter(post_id=like.post_id, visitor_id=like.visitor_id).exists():
+            like.delete()
+        else:
+            like.save(update_fields=['visitor_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_image_url'),
+    ]
+
+    operations = [
+        migrations.RunPython(shorten_visitor_ids, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='visitor_id',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('post', 'visitor_id'), name='like_post_visitor_uniq'),
+        ),
+    ]
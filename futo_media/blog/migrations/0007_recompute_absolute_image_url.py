@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-15 05:10
+
+from django.db import migrations
+from django.db.models import F, Q
+
+
+def recompute_image_url(apps, schema_editor):
+    # image_url of posts storing an absolute URL was saved truncated; for those the
+    # canonical URL is the stored value itself, so copy the column over in SQL
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.filter(Q(image__startswith='https://') | Q(image__startswith='http://')).update(image_url=F('image'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_like_post_visitor_uniq'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_image_url, migrations.RunPython.noop),
+    ]
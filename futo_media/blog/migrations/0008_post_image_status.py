@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_recompute_absolute_image_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Upload pending'), ('failed', 'Upload failed')], default='', editable=False, max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_source_url',
+            field=models.URLField(blank=True, default='', editable=False, max_length=500),
+        ),
+    ]
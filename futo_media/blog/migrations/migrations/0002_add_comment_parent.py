@@ -1,17 +0,0 @@
-# Generated by Django A migration example - adjust dependencies to your project
-from django.db import migrations, models
-import django.db.models.deletion
-
-class Migration(migrations.Migration):
-
-    dependencies = [
-        ('blog', '0001_initial'),  # change if your last migration is named differently
-    ]
-
-    operations = [
-        migrations.AddField(
-            model_name='comment',
-            name='parent',
-            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.comment'),
-        ),
-    ]
@@ -1,23 +1,130 @@
 # blog/models.py
-from django.db import models
+import hashlib
+import itertools
+import re
+import secrets
+import uuid
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Left
 from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
+from cloudinary import CloudinaryResource
 from cloudinary.models import CloudinaryField 
 
 User = get_user_model()
 
+# Random-suffix attempts on a slug collision before falling back to generate_unique_slug
+SLUG_RETRIES = 5
+# Characters of content returned as content_preview on the post list
+CONTENT_PREVIEW_LENGTH = 200
+
+
+def base_slug(title):
+    # titles with nothing slugify can keep (e.g. only emoji) still get a slug
+    return slugify(title)[:200] or uuid.uuid4().hex[:8]
+
 
 def generate_unique_slug(instance, value):
     base = slugify(value)[:200]
-    slug = base
     ModelClass = instance.__class__
-    counter = 1
-    while ModelClass.objects.filter(slug=slug).exclude(pk=instance.pk).exists():
+    # fetch every taken "base" / "base-N" slug in one query, then pick locally
+    existing = set(
+        ModelClass.objects.filter(slug__regex=rf"^{re.escape(base)}(-\d+)?$")
+        .exclude(pk=instance.pk)
+        .values_list("slug", flat=True)
+    )
+    if base not in existing:
+        return base
+    for counter in itertools.count(1):
         slug = f"{base}-{counter}"
-        counter += 1
-    return slug
+        if slug not in existing:
+            return slug
+
+
+def canonical_image_url(image):
+    """
+    Returns the CDN URL for a Post.image value (a CloudinaryResource or a stored
+    string), or "" when there is no image or it hasn't been uploaded yet.
+    """
+    if not image:
+        return ""
+    # CloudinaryField parses every stored value as a public_id, taking the format from
+    # the first '.', which mangles absolute URLs ("https://res.cloudinary" ...). Those
+    # are returned unchanged, whether given as a string or as a resource loaded from the DB.
+    if isinstance(image, CloudinaryResource):
+        # undo the split: an absolute URL ends up as public_id "https://res" + format
+        stored = f"{image.public_id}.{image.format}" if image.format else image.public_id
+    else:
+        stored = image
+    if isinstance(stored, str) and stored.startswith(("https://", "http://")):
+        return stored
+    if isinstance(image, str):
+        image = Post._meta.get_field("image").to_python(image)
+    # CloudinaryField exposes .url (absolute https) when configured correctly;
+    # anything without one (or failing to build it) lands in the except
+    try:
+        return image.url or ""
+    except Exception:
+        return ""
+
+
+class ImageURLField(models.URLField):
+    """
+    Denormalized copy of the model's image URL, recomputed on every save so reads
+    don't have to build it. Must be declared after `image`: fields are pre_saved in
+    order, so by then CloudinaryField.pre_save has uploaded any new file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_length", 500)
+        kwargs.setdefault("blank", True)
+        kwargs.setdefault("default", "")
+        kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = canonical_image_url(model_instance.image)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def _count_per_post(queryset):
+    # correlated COUNT(*) for the outer post; unlike joining both relations and
+    # counting DISTINCT, each one is answered from its own (post, ...) index
+    counts = queryset.filter(post_id=OuterRef("pk")).order_by().values("post_id").annotate(n=Count("*")).values("n")
+    return Coalesce(Subquery(counts), 0)
+
+
+class PostQuerySet(models.QuerySet):
+    def with_counts(self):
+        # annotate counts in the same query to avoid a COUNT per post
+        return self.annotate(
+            likes_count=_count_per_post(Like.objects.all()),
+            comments_count=_count_per_post(Comment.objects.filter(is_active=True)),
+        )
+
+    def with_preview(self):
+        # leave the full body behind and let the DB cut the preview instead
+        return self.defer("content").annotate(content_preview=Left("content", CONTENT_PREVIEW_LENGTH))
+
+    def with_comment_tree(self):
+        # all active comments of each post in one query; serializers group them by parent
+        return self.prefetch_related(
+            Prefetch(
+                "comments",
+                queryset=Comment.objects.filter(is_active=True).order_by("created_at"),
+                to_attr="_prefetched_comments",
+            )
+        )
+
+
+IMAGE_PENDING = "pending"
+IMAGE_FAILED = "failed"
+IMAGE_STATUS_CHOICES = [(IMAGE_PENDING, "Upload pending"), (IMAGE_FAILED, "Upload failed")]
 
 
 class Post(models.Model):
@@ -34,59 +141,61 @@ class Post(models.Model):
         null=True,
         max_length=500
     )
+    image_url = ImageURLField()
+    # state of a background image_url upload; blank once the image (if any) is in place
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True, default="", editable=False)
+    # remote URL of a pending (or failed) background upload, kept so it can be retried
+    image_source_url = models.URLField(max_length=500, blank=True, default="", editable=False)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
 
     def __str__(self):
         return self.title
 
-    # NOTE: these properties now accept annotated values from queryset.
-    # Django will be able to set .likes_count and .comments_count when using annotate().
-    @property
-    def likes_count(self):
-        # Prefer an annotated value stored on the instance (set by queryset annotation).
-        if "likes_count" in self.__dict__:
-            try:
-                return int(self.__dict__["likes_count"])
-            except Exception:
-                pass
-        # fallback to counting related likes
-        return self.likes.count()
-
-    @likes_count.setter
-    def likes_count(self, value):
-        # allow Django to set annotated value
-        try:
-            self.__dict__["likes_count"] = int(value)
-        except Exception:
-            self.__dict__["likes_count"] = value
-
-    @property
-    def comments_count(self):
-        if "comments_count" in self.__dict__:
+    def save(self, *args, **kwargs):
+        # image_url is derived from image, so write it whenever image is written
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "image" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "image_url"}
+
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        # Optimistic slug: ensure_slug fills in the plain slugified title without a
+        # uniqueness query; only on a collision retry with a random suffix.
+        for _ in range(SLUG_RETRIES):
             try:
-                return int(self.__dict__["comments_count"])
-            except Exception:
-                pass
-        # fallback to counting active comments
-        return self.comments.filter(is_active=True).count()
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if not Post.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
+                    raise
+                self.slug = f"{base_slug(self.title)}-{secrets.token_hex(3)}"
+        self.slug = generate_unique_slug(self, self.title)
+        return super().save(*args, **kwargs)
+
+    # NOTE: these counts come from Post.objects.with_counts(). annotate() stores the
+    # value in the instance __dict__, which shadows these cached_properties, so they
+    # only run (and refuse to issue a COUNT per post) when the annotation is missing.
+    @cached_property
+    def likes_count(self):
+        raise AttributeError("likes_count is not annotated; load posts with Post.objects.with_counts()")
 
-    @comments_count.setter
-    def comments_count(self, value):
-        try:
-            self.__dict__["comments_count"] = int(value)
-        except Exception:
-            self.__dict__["comments_count"] = value
+    @cached_property
+    def comments_count(self):
+        raise AttributeError("comments_count is not annotated; load posts with Post.objects.with_counts()")
 
 
-@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Post, dispatch_uid="post_ensure_slug")
 def ensure_slug(sender, instance, **kwargs):
     if not instance.slug:
-        instance.slug = generate_unique_slug(instance, instance.title)
+        instance.slug = base_slug(instance.title)
 
 
 class Comment(models.Model):
@@ -100,18 +209,39 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # matches the comment-tree lookups: by post, parent and is_active, ordered by created_at
+            models.Index(fields=["post", "parent", "is_active", "created_at"], name="comment_tree_idx"),
+        ]
 
     def __str__(self):
         return f"Comment by {self.name}"
 
 
+VISITOR_ID_MAX_LENGTH = 64
+
+
+def normalize_visitor_id(value):
+    """
+    Keeps visitor ids within VISITOR_ID_MAX_LENGTH (a UUID hex or an IP fits as is);
+    longer ids are replaced by their sha256 hex digest, which is stable per visitor.
+    """
+    value = str(value)
+    if len(value) <= VISITOR_ID_MAX_LENGTH:
+        return value
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
 class Like(models.Model):
     post = models.ForeignKey(Post, related_name="likes", on_delete=models.CASCADE)
-    visitor_id = models.CharField(max_length=255)
+    # short keys keep the (post, visitor_id) unique index small
+    visitor_id = models.CharField(max_length=VISITOR_ID_MAX_LENGTH)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ("post", "visitor_id")
+        constraints = [
+            models.UniqueConstraint(fields=["post", "visitor_id"], name="like_post_visitor_uniq"),
+        ]
 
     def __str__(self):
         return f"Like {self.post_id} by {self.visitor_id}"
@@ -0,0 +1,34 @@
+# blog/renderers.py
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson is optional; without it the renderer behaves exactly like DRF's JSONRenderer
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed. Serializers have
+    already turned datetimes etc. into strings, so the output matches the stdlib
+    encoder; anything orjson can't handle natively goes through DRF's encoder.
+    orjson only writes compact UTF-8, so an indent (e.g. for the browsable API) or
+    non-default UNICODE_JSON / COMPACT_JSON / STRICT_JSON settings render through DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        # validation errors of list fields are keyed by int index
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_NON_STR_KEYS)
+        # escape the JS line separators like JSONRenderer does, keeping output embeddable
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
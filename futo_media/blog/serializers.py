@@ -1,7 +1,53 @@
 # blog/serializers.py
+from collections import defaultdict
 from rest_framework import serializers
 from .models import Post, Comment
 
+# Deepest reply level serialized under a top-level comment (top-level is depth 0)
+MAX_REPLY_DEPTH = 2
+# CommentSerializer fields read from another model attribute (foreign keys by id)
+_COMMENT_FIELD_ATTRS = {"post": "post_id", "parent": "parent_id"}
+
+
+def build_reply_map(comments):
+    """
+    Groups comments by parent_id (top-level comments under None) so a whole
+    comment tree can be serialized from one query.
+    """
+    by_parent = defaultdict(list)
+    for c in comments:
+        by_parent[c.parent_id].append(c)
+    return by_parent
+
+
+def serialize_comment_tree(comments, max_depth=MAX_REPLY_DEPTH):
+    """
+    Serializes active comments (ordered by created_at) into the nested shape
+    CommentSerializer produces, in one flat pass per level instead of a
+    serializer instance per comment. Replies below max_depth come back empty.
+    """
+    reply_map = build_reply_map(comments)
+    created_at = serializers.DateTimeField()
+    fields = CommentSerializer.Meta.fields
+
+    def represent(c):
+        rep = {f: [] if f == "replies" else getattr(c, _COMMENT_FIELD_ATTRS.get(f, f)) for f in fields}
+        rep["created_at"] = created_at.to_representation(c.created_at)
+        return rep
+
+    level = [(c, represent(c)) for c in reply_map.get(None, [])]
+    roots = [rep for _, rep in level]
+    for _ in range(max_depth):
+        children = []
+        for c, rep in level:
+            for child in reply_map.get(c.id, ()):
+                child_rep = represent(child)
+                rep["replies"].append(child_rep)
+                children.append((child, child_rep))
+        level = children
+    return roots
+
+
 class CommentSerializer(serializers.ModelSerializer):
     parent = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.all(), allow_null=True, required=False)
     replies = serializers.SerializerMethodField()
@@ -12,13 +58,19 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at", "post", "replies"]
 
     def get_replies(self, obj):
+        # bound the recursion so deep threads don't build a serializer per level
+        depth = self.context.get("_depth", 0)
+        if depth >= MAX_REPLY_DEPTH:
+            return []
         qs = obj.replies.filter(is_active=True).order_by("created_at")
-        return CommentSerializer(qs, many=True, context=self.context).data
+        context = {**self.context, "_depth": depth + 1}
+        return CommentSerializer(qs, many=True, context=context).data
 
 
 class PostListSerializer(serializers.ModelSerializer):
     likes_count = serializers.IntegerField(read_only=True)
     comments_count = serializers.IntegerField(read_only=True)
+    content_preview = serializers.CharField(read_only=True)
     image_url = serializers.SerializerMethodField()
 
     class Meta:
@@ -28,7 +80,7 @@ class PostListSerializer(serializers.ModelSerializer):
             "title",
             "subtitle",
             "slug",
-            "content",
+            "content_preview",
             "image_url",
             "created_at",
             "likes_count",
@@ -36,29 +88,25 @@ class PostListSerializer(serializers.ModelSerializer):
         ]
 
     def get_image_url(self, obj):
-        # CloudinaryField exposes .url (absolute https) when configured correctly
-        try:
-            if obj.image:
-                # obj.image.url is the canonical CDN URL
-                url = getattr(obj.image, "url", None)
-                if url:
-                    return url
-        except Exception:
-            pass
-
-        # Fallbacks (shouldn't be necessary when using CloudinaryField):
-        return None
+        # canonical CDN URL precomputed on save (see Post.image_url)
+        return obj.image_url or None
 
 
 class PostDetailSerializer(PostListSerializer):
     top_level_comments = serializers.SerializerMethodField()
 
     class Meta(PostListSerializer.Meta):
-        fields = PostListSerializer.Meta.fields + ["top_level_comments"]
+        # the detail view returns the full body in place of the preview
+        fields = [
+            "content" if f == "content_preview" else f for f in PostListSerializer.Meta.fields
+        ] + ["image_status", "top_level_comments"]
 
     def get_top_level_comments(self, obj):
-        qs = obj.comments.filter(parent__isnull=True, is_active=True).order_by("created_at")
-        return CommentSerializer(qs, many=True, context=self.context).data
+        # prefer comments prefetched by Post.objects.with_comment_tree()
+        comments = getattr(obj, "_prefetched_comments", None)
+        if comments is None:
+            comments = obj.comments.filter(is_active=True).order_by("created_at")
+        return serialize_comment_tree(comments)
 
 
 class PostCreateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,82 @@
+# blog/tasks.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import IMAGE_FAILED, Post, canonical_image_url
+
+try:
+    import cloudinary.uploader
+    _CLOUDINARY_AVAILABLE = True
+except Exception:
+    cloudinary = None
+    _CLOUDINARY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# No task queue is deployed, so background uploads run on a small in-process pool
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="blog-upload")
+
+
+def cloudinary_configured():
+    # the package importing isn't enough, uploads also need the credentials
+    return _CLOUDINARY_AVAILABLE and settings.USE_CLOUDINARY
+
+
+def upload_remote_to_cloudinary(url):
+    """
+    Uploads an external image URL to Cloudinary folder 'futo_media/posts'.
+    Returns the Cloudinary public_id (string) on success, or raises exception.
+    """
+    if not _CLOUDINARY_AVAILABLE:
+        raise RuntimeError("Cloudinary is not available on the server (missing package/config).")
+
+    # Basic upload options: place into folder futo_media/posts, preserve resource_type=image
+    result = cloudinary.uploader.upload(
+        url,
+        folder="futo_media/posts",
+        resource_type="image",
+        use_filename=True,
+        unique_filename=True,
+    )
+    # result should contain 'public_id' and 'secure_url'
+    public_id = result.get("public_id")
+    if not public_id:
+        raise RuntimeError(f"Cloudinary upload did not return public_id: {result}")
+    return public_id
+
+
+def attach_remote_image(post_id, url):
+    """
+    Uploads `url` to Cloudinary and attaches the result to post `post_id`,
+    clearing its image_status and image_source_url. Failures are logged and the
+    post's image_status is set to "failed"; image_source_url is kept for a retry.
+    Returns True when the image was attached.
+    """
+    try:
+        public_id = upload_remote_to_cloudinary(url)
+    except Exception:
+        logger.exception("Remote image upload failed for post %s (%s)", post_id, url)
+        Post.objects.filter(pk=post_id).update(image_status=IMAGE_FAILED)
+        return False
+    Post.objects.filter(pk=post_id).update(
+        image=public_id, image_url=canonical_image_url(public_id), image_status="", image_source_url=""
+    )
+    return True
+
+
+def upload_remote_image_task(post_id, url):
+    try:
+        attach_remote_image(post_id, url)
+    except Exception:
+        logger.exception("Remote image upload task failed for post %s", post_id)
+    finally:
+        # worker threads get their own DB connections, don't leave them open
+        connections.close_all()
+
+
+def enqueue_remote_image_upload(post_id, url):
+    # submit after commit so the worker can see the post row
+    transaction.on_commit(lambda: _executor.submit(upload_remote_image_task, post_id, url))
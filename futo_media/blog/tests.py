@@ -1,3 +1,385 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import cloudinary
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+
+from .management.commands.fix_and_migrate_images import bulk_decode_stored_values
+from .models import IMAGE_FAILED, IMAGE_PENDING, Comment, Like, Post, canonical_image_url
+from .renderers import ORJSONRenderer
+from .serializers import MAX_REPLY_DEPTH, CommentSerializer, serialize_comment_tree
+from .tasks import attach_remote_image
+from .views import PostViewSet
+
+
+def stored_images():
+    # raw column values by pk; the field itself would parse them as public_ids
+    return dict(Post.objects.annotate(raw=Cast("image", CharField())).values_list("pk", "raw"))
+
+
+class CanonicalImageURLTests(TestCase):
+    def test_empty_values(self):
+        self.assertEqual(canonical_image_url(None), "")
+        self.assertEqual(canonical_image_url(""), "")
+
+    def test_absolute_urls_are_returned_unchanged(self):
+        for url in (
+            "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2",
+            "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2.jpg",
+            "http://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2",
+            "https://example.com/images/photo.png",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(canonical_image_url(url), url)
+
+    def test_extensionless_cloudinary_url_survives_a_db_round_trip(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2"
+        post = Post.objects.create(title="Image", content="body", image=url)
+        post = Post.objects.get(pk=post.pk)
+        self.assertEqual(post.image_url, url)
+        self.assertEqual(canonical_image_url(post.image), url)
+        # saving again recomputes image_url from the resource loaded above
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_url, url)
+
+
+class SlugTests(TestCase):
+    def test_first_post_gets_the_plain_slug(self):
+        self.assertEqual(Post.objects.create(title="Hello World", content="c").slug, "hello-world")
+
+    def test_collision_retries_with_a_random_suffix(self):
+        Post.objects.create(title="Hello", content="c")
+        post = Post.objects.create(title="Hello", content="c")
+        self.assertRegex(post.slug, r"^hello-[0-9a-f]{6}$")
+
+    def test_falls_back_to_a_counter_when_the_retries_collide(self):
+        Post.objects.create(title="Hello", content="c")
+        Post.objects.create(title="Hello", content="c", slug="hello-aaaaaa")
+        with mock.patch("blog.models.secrets.token_hex", return_value="aaaaaa"):
+            post = Post.objects.create(title="Hello", content="c")
+        self.assertEqual(post.slug, "hello-1")
+
+    def test_title_without_sluggable_characters(self):
+        post = Post.objects.create(title="🎉🎉", content="c")
+        self.assertRegex(post.slug, r"^[0-9a-f]{8}$")
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.post = Post.objects.create(title="Liked", content="c")
+        self.url = f"/api/posts/{self.post.slug}/like/"
+
+    def test_like_then_unlike(self):
+        r = self.client.post(self.url, {"visitor_id": "v1"}, format="json")
+        self.assertEqual(r.json(), {"likes_count": 1, "liked": True})
+        r = self.client.post(self.url, {"visitor_id": "v1"}, format="json")
+        self.assertEqual(r.json(), {"likes_count": 0, "liked": False})
+        self.assertFalse(Like.objects.exists())
+
+    def test_concurrent_like_is_reported_as_liked(self):
+        # the unique constraint fired: another request created the like first
+        with mock.patch.object(Like.objects, "create", side_effect=IntegrityError):
+            r = self.client.post(self.url, {"visitor_id": "v1"}, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {"likes_count": 1, "liked": True})
+
+
+class PostListETagTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.post = Post.objects.create(title="Listed", content="c")
+
+    def test_unchanged_list_returns_304(self):
+        etag = self.client.get("/api/posts/")["ETag"]
+        r = self.client.get("/api/posts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r["ETag"], etag)
+
+    def test_like_changes_the_etag(self):
+        etag = self.client.get("/api/posts/")["ETag"]
+        Like.objects.create(post=self.post, visitor_id="v1")
+        r = self.client.get("/api/posts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r["ETag"], etag)
+        self.assertEqual(r.json()[0]["likes_count"], 1)
+
+    def test_paginated_list_returns_the_page_and_tags_it(self):
+        Post.objects.create(title="Newer", content="c")
+
+        class OnePerPage(PageNumberPagination):
+            page_size = 1
+
+        with mock.patch.object(PostViewSet, "pagination_class", OnePerPage):
+            r = self.client.get("/api/posts/")
+            self.assertEqual(r.json()["count"], 2)
+            self.assertEqual([p["title"] for p in r.json()["results"]], ["Newer"])
+            etag = r["ETag"]
+            self.assertEqual(self.client.get("/api/posts/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # a like on the other page leaves this page alone, the ETag with it
+            Like.objects.create(post=self.post, visitor_id="v1")
+            self.assertEqual(self.client.get("/api/posts/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertNotEqual(self.client.get("/api/posts/?page=2", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # a new post changes the count
+            Post.objects.create(title="Newest", content="c")
+            self.assertEqual(self.client.get("/api/posts/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        self.post = Post.objects.create(title="Thread", content="c")
+        parent = None
+        # one level deeper than MAX_REPLY_DEPTH, which must be cut off
+        for depth in range(MAX_REPLY_DEPTH + 2):
+            parent = Comment.objects.create(post=self.post, parent=parent, name=f"d{depth}", content="c")
+        Comment.objects.create(post=self.post, name="second", content="c", email="a@example.com")
+        Comment.objects.create(post=self.post, name="hidden", content="c", is_active=False)
+
+    def test_matches_comment_serializer(self):
+        comments = self.post.comments.filter(is_active=True).order_by("created_at")
+        expected = CommentSerializer(comments.filter(parent=None), many=True).data
+        # compare as JSON: the serializer returns ReturnDict/OrderedDict instances
+        self.assertEqual(json.dumps(serialize_comment_tree(comments)), json.dumps(expected))
+
+    def test_reply_below_max_depth_is_rejected(self):
+        deepest = Comment.objects.get(name=f"d{MAX_REPLY_DEPTH}")
+        r = APIClient().post(
+            f"/api/posts/{self.post.slug}/comments/",
+            {"name": "n", "content": "c", "parent": deepest.pk},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("parent", r.json())
+
+    def test_reply_at_max_depth_is_accepted(self):
+        parent = Comment.objects.get(name=f"d{MAX_REPLY_DEPTH - 1}")
+        r = APIClient().post(
+            f"/api/posts/{self.post.slug}/comments/",
+            {"name": "n", "content": "c", "parent": parent.pk},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 201)
+
+
+class RemoteImageTests(TestCase):
+    def test_image_url_rejected_without_cloudinary(self):
+        with override_settings(USE_CLOUDINARY=False):
+            r = APIClient().post(
+                "/api/posts/",
+                {"title": "T", "content": "c", "image_url": "https://example.com/a.jpg"},
+                format="json",
+            )
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_invalid_image_url_rejected(self):
+        with override_settings(USE_CLOUDINARY=True), mock.patch("blog.tasks._CLOUDINARY_AVAILABLE", True):
+            r = APIClient().post("/api/posts/", {"title": "T", "content": "c", "image_url": "not a url"}, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_create_stores_the_pending_upload(self):
+        with (
+            override_settings(USE_CLOUDINARY=True),
+            mock.patch("blog.tasks._CLOUDINARY_AVAILABLE", True),
+            self.captureOnCommitCallbacks() as callbacks,
+        ):
+            r = APIClient().post(
+                "/api/posts/",
+                {"title": "T", "content": "c", "image_url": "https://example.com/a.jpg"},
+                format="json",
+            )
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json()["image_status"], IMAGE_PENDING)
+        post = Post.objects.get()
+        self.assertEqual((post.image_status, post.image_source_url), (IMAGE_PENDING, "https://example.com/a.jpg"))
+        # the upload is handed to the executor once the post is committed
+        self.assertEqual(len(callbacks), 1)
+
+
+@mock.patch("blog.tasks._CLOUDINARY_AVAILABLE", True)
+class PendingImageUploadTests(TestCase):
+    url = "https://example.com/a.jpg"
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            title="Pending", content="c", image_status=IMAGE_PENDING, image_source_url=self.url
+        )
+
+    def test_pending_to_ready(self):
+        with mock.patch("cloudinary.uploader.upload", return_value={"public_id": "futo_media/posts/a"}) as upload:
+            self.assertTrue(attach_remote_image(self.post.pk, self.url))
+        upload.assert_called_once()
+        self.assertEqual(stored_images()[self.post.pk], "futo_media/posts/a")
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.image_status, self.post.image_source_url), ("", ""))
+
+    def test_pending_to_failed(self):
+        with mock.patch("cloudinary.uploader.upload", side_effect=OSError("unreachable")):
+            self.assertFalse(attach_remote_image(self.post.pk, self.url))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_status, IMAGE_FAILED)
+        # kept for a retry
+        self.assertEqual(self.post.image_source_url, self.url)
+
+    def make_stale(self):
+        Post.objects.filter(pk=self.post.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+    @override_settings(USE_CLOUDINARY=True)
+    def test_retry_command_uploads_stale_posts(self):
+        fresh = Post.objects.create(title="Fresh", content="c", image_status=IMAGE_PENDING, image_source_url=self.url)
+        self.make_stale()
+        with mock.patch("cloudinary.uploader.upload", return_value={"public_id": "futo_media/posts/a"}) as upload:
+            call_command("retry_pending_image_uploads", stdout=StringIO())
+        upload.assert_called_once()
+        self.post.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(self.post.image_status, "")
+        self.assertEqual(fresh.image_status, IMAGE_PENDING)
+
+    def test_retry_command_can_mark_stale_posts_failed(self):
+        self.make_stale()
+        with mock.patch("cloudinary.uploader.upload") as upload:
+            call_command("retry_pending_image_uploads", "--mark-failed", stdout=StringIO())
+        upload.assert_not_called()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_status, IMAGE_FAILED)
+
+
+class ORJSONRendererTests(TestCase):
+    def test_int_keys(self):
+        self.assertEqual(ORJSONRenderer().render({"tags": {0: ["bad"]}}), b'{"tags":{"0":["bad"]}}')
+
+    def test_indent_uses_the_stdlib_encoder(self):
+        self.assertIn(b"\n", ORJSONRenderer().render({"a": 1}, renderer_context={"indent": 4}))
+
+
+class FixAndMigrateImagesTests(TestCase):
+    def test_bulk_decode(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2"
+        encoded = Post.objects.create(title="a", content="c", image="https%3A%2F%2Fres.cloudinary.com%2Fdemo%2Fimage%2Fupload%2Fv1%2Ffuto_media%2Fposts%2Fup2")
+        prefixed = Post.objects.create(title="b", content="c", image="/media/" + url)
+        untouched = Post.objects.create(title="c", content="c", image="https://example.com/a%20b.jpg")
+
+        self.assertEqual(bulk_decode_stored_values(), 2)
+        images = stored_images()
+        self.assertEqual(images[encoded.pk], url)
+        self.assertEqual(images[prefixed.pk], url)
+        self.assertEqual(images[untouched.pk], "https://example.com/a%20b.jpg")
+        self.assertEqual(Post.objects.get(pk=encoded.pk).image_url, url)
+
+    def test_command_decodes_and_reports(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2"
+        post = Post.objects.create(title="a", content="c", image="/media/https%3A//res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2")
+        Post.objects.create(title="no image", content="c")
+        out = StringIO()
+        with mock.patch("cloudinary.uploader.upload") as upload:
+            call_command("fix_and_migrate_images", stdout=out)
+        upload.assert_not_called()
+        self.assertEqual(stored_images()[post.pk], url)
+        self.assertIn("Decoded 1 stored image value(s) in bulk", out.getvalue())
+
+
+@override_settings(CLOUDINARY_CLOUD_NAME="demo")
+class MigrateMediaToCloudinaryTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, "post_images"))
+        with open(os.path.join(self.media_root, "post_images", "a.png"), "wb") as fh:
+            fh.write(b"png")
+
+    def test_uploads_local_files_and_skips_the_rest(self):
+        local = Post.objects.create(title="local", content="c", image="post_images/a.png")
+        missing = Post.objects.create(title="missing", content="c", image="post_images/gone.png")
+        remote = Post.objects.create(title="remote", content="c", image="https://example.com/x.jpg")
+        result = {"public_id": "futo_media/posts/a", "secure_url": "https://res.cloudinary.com/demo/a"}
+        with override_settings(MEDIA_ROOT=self.media_root), mock.patch("cloudinary.uploader.upload", return_value=result) as upload:
+            call_command("migrate_media_to_cloudinary", stdout=StringIO())
+
+        self.assertEqual(upload.call_count, 1)
+        images = stored_images()
+        self.assertEqual(images[local.pk], "futo_media/posts/a")
+        self.assertEqual(Post.objects.get(pk=local.pk).image_url, canonical_image_url("futo_media/posts/a"))
+        self.assertEqual(images[missing.pk], "post_images/gone.png")
+        self.assertEqual(images[remote.pk], "https://example.com/x.jpg")
+
+    def test_writes_every_batch(self):
+        posts = [Post.objects.create(title=f"p{i}", content="c", image="post_images/a.png") for i in range(3)]
+        results = [{"public_id": f"futo_media/posts/p{i}", "secure_url": ""} for i in range(3)]
+        with (
+            override_settings(MEDIA_ROOT=self.media_root),
+            mock.patch("cloudinary.uploader.upload", side_effect=results),
+            mock.patch("blog.management.commands.migrate_media_to_cloudinary.BATCH_SIZE", 2),
+        ):
+            call_command("migrate_media_to_cloudinary", stdout=StringIO())
+
+        images = stored_images()
+        # posts are visited newest first, so compare regardless of order
+        self.assertCountEqual([images[p.pk] for p in posts], [r["public_id"] for r in results])
+
+
+class ImageURLMigrationTests(TransactionTestCase):
+    """Runs the image_url data migrations over rows that exist before them."""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("blog", target)])
+        return executor.loader.project_state([("blog", target)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_0005_backfills_without_model_code(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2"
+        OldPost = self.migrate("0004_comment_tree_idx").get_model("blog", "Post")
+        absolute = OldPost.objects.create(title="a", slug="a", content="c", image=url)
+        public_id = OldPost.objects.create(title="b", slug="b", content="c", image="futo_media/posts/b")
+
+        # without Cloudinary credentials public_id rows are left for fix_and_migrate_images
+        with mock.patch.object(cloudinary.config(), "cloud_name", None, create=True):
+            apps = self.migrate("0005_post_image_url")
+        image_urls = dict(apps.get_model("blog", "Post").objects.values_list("pk", "image_url"))
+        self.assertEqual(image_urls[absolute.pk], url)
+        self.assertEqual(image_urls[public_id.pk], "")
+
+    def test_0005_builds_public_id_urls_with_credentials(self):
+        OldPost = self.migrate("0004_comment_tree_idx").get_model("blog", "Post")
+        post = OldPost.objects.create(title="b", slug="b", content="c", image="futo_media/posts/b")
+
+        with mock.patch.object(cloudinary.config(), "cloud_name", "demo", create=True):
+            apps = self.migrate("0005_post_image_url")
+        image_url = apps.get_model("blog", "Post").objects.get(pk=post.pk).image_url
+        self.assertRegex(image_url, r"^https?://res\.cloudinary\.com/demo/image/upload/.*futo_media/posts/b$")
+
+    def test_0007_repairs_truncated_absolute_urls(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/futo_media/posts/up2"
+        apps = self.migrate("0006_like_post_visitor_uniq")
+        OldPost = apps.get_model("blog", "Post")
+        post = OldPost.objects.create(title="a", slug="a", content="c", image=url)
+        public_id = OldPost.objects.create(title="b", slug="b", content="c", image="futo_media/posts/b")
+        # what the earlier code saved; set with update(), ImageURLField.pre_save recomputes on save
+        OldPost.objects.filter(pk=post.pk).update(image_url="https://res.cloudinary")
+        OldPost.objects.filter(pk=public_id.pk).update(image_url="kept")
+
+        image_urls = dict(
+            self.migrate("0007_recompute_absolute_image_url").get_model("blog", "Post").objects.values_list("pk", "image_url")
+        )
+        self.assertEqual(image_urls[post.pk], url)
+        self.assertEqual(image_urls[public_id.pk], "kept")
@@ -1,8 +1,9 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import SimpleRouter
 from .views import PostViewSet
 
-router = DefaultRouter()
+# no browsable API root or format-suffix routes, just the viewset URLs
+router = SimpleRouter(trailing_slash=True)
 router.register(r'posts', PostViewSet, basename='post')
 
 urlpatterns = [
@@ -1,26 +1,69 @@
 # blog/views.py
+import hashlib
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.db.models import Count, Q
-from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import IntegrityError, transaction
+from django.utils.cache import get_conditional_response, quote_etag
 
-from .models import Post, Comment, Like
+from .models import IMAGE_PENDING, Post, Comment, Like, normalize_visitor_id
 from .serializers import (
     PostListSerializer,
     PostDetailSerializer,
     PostCreateSerializer,
     CommentSerializer,
+    MAX_REPLY_DEPTH,
+    serialize_comment_tree,
 )
+from .tasks import cloudinary_configured, enqueue_remote_image_upload, upload_remote_to_cloudinary
+
+_validate_image_url = URLValidator(schemes=["http", "https"])
+
+
+def _image_url_error(image_url):
+    """
+    Returns why a remote `image_url` can't be accepted, or None when it can.
+    Checked up front so a background upload only gets URLs it can attempt.
+    """
+    if not cloudinary_configured():
+        return "Cloudinary not configured on server. Provide a file upload instead."
+    try:
+        _validate_image_url(image_url)
+    except ValidationError:
+        return "Enter a valid http(s) URL."
+    # stored on the post until the upload finishes
+    if len(image_url) > Post._meta.get_field("image_source_url").max_length:
+        return "URL is too long."
+    return None
+
+
+def _without_image_url(data):
+    """
+    Returns the request payload without 'image_url' (the serializer expects an
+    ImageField). Only copies it when the key is actually there, since copying a
+    multipart QueryDict is not free.
+    """
+    if "image_url" not in data:
+        return data
+    data = data.copy()
+    data.pop("image_url")
+    return data
+
 
-# Try to import cloudinary.uploader — it's optional (we handle absence)
-try:
-    import cloudinary.uploader
-    _CLOUDINARY_AVAILABLE = True
-except Exception:
-    cloudinary = None
-    _CLOUDINARY_AVAILABLE = False
+def _comment_depth(comment):
+    """
+    Depth of `comment` in its thread (top-level is 0), counted up to just past
+    MAX_REPLY_DEPTH, which is all the reply check needs.
+    """
+    depth = 0
+    while comment.parent_id is not None and depth <= MAX_REPLY_DEPTH:
+        comment = comment.parent
+        depth += 1
+    return depth
 
 
 class PostViewSet(viewsets.ModelViewSet):
@@ -31,7 +74,9 @@ class PostViewSet(viewsets.ModelViewSet):
       When 'image_url' is provided and Cloudinary is configured, the backend uploads
       that remote image to Cloudinary into folder "futo_media/posts" and attaches
       the Cloudinary public_id to the Post so `.image.url` will return the
-      canonical HTTPS CDN URL.
+      canonical HTTPS CDN URL. On create the upload runs in the background: the
+      post's image_status is "pending" until it finishes and "failed" if it doesn't,
+      with the source URL kept in image_source_url (see retry_pending_image_uploads).
     - comments action supports threaded replies via 'parent' field and validates parent belongs to the same post.
     """
     queryset = Post.objects.all().order_by("-created_at")
@@ -40,14 +85,11 @@ class PostViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # annotate counts to avoid N+1 on serializer side
-        qs = (
-            Post.objects.all()
-            .order_by("-created_at")
-            .annotate(
-                likes_count=Count("likes", distinct=True),
-                comments_count=Count("comments", filter=Q(comments__is_active=True), distinct=True),
-            )
-        )
+        qs = Post.objects.with_counts().order_by("-created_at")
+        if self.action == "list":
+            qs = qs.with_preview()
+        elif self.action == "retrieve":
+            qs = qs.with_comment_tree()
         return qs
 
     def get_serializer_class(self):
@@ -62,64 +104,55 @@ class PostViewSet(viewsets.ModelViewSet):
         ctx["request"] = self.request
         return ctx
 
-    def _upload_remote_to_cloudinary(self, url):
+    def list(self, request, *args, **kwargs):
         """
-        Uploads an external image URL to Cloudinary folder 'futo_media/posts'.
-        Returns the Cloudinary public_id (string) on success, or raises exception.
+        Post list with an ETag, so clients revalidating an unchanged list get a
+        304 without the posts being serialized or rendered again. When pagination
+        is configured the ETag covers the page returned, including its links.
         """
-        if not _CLOUDINARY_AVAILABLE:
-            raise RuntimeError("Cloudinary is not available on the server (missing package/config).")
-
-        # Basic upload options: place into folder futo_media/posts, preserve resource_type=image
-        result = cloudinary.uploader.upload(
-            url,
-            folder="futo_media/posts",
-            resource_type="image",
-            use_filename=True,
-            unique_filename=True,
-        )
-        # result should contain 'public_id' and 'secure_url'
-        public_id = result.get("public_id")
-        if not public_id:
-            raise RuntimeError(f"Cloudinary upload did not return public_id: {result}")
-        return public_id
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        posts = list(queryset) if page is None else page
+        # covers every value a list row is built from; counts and image_url can
+        # change without touching updated_at
+        version = [(p.pk, p.updated_at, p.likes_count, p.comments_count, p.image_url) for p in posts]
+        if page is not None:
+            # count / next / previous, which can change while the page itself doesn't
+            version.append(self.get_paginated_response([]).data)
+        etag = quote_etag(hashlib.md5(repr(version).encode(), usedforsecurity=False).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = self.get_serializer(posts, many=True).data
+            response = Response(data) if page is None else self.get_paginated_response(data)
+        response["ETag"] = etag
+        return response
 
     def create(self, request, *args, **kwargs):
         """
         Accepts file upload via `image` or a remote `image_url` string.
-        For image_url, uploads to Cloudinary (if available) then creates Post and attaches the Cloudinary public id.
+        For image_url, creates the Post right away and uploads the image to Cloudinary
+        in the background; the public id is attached once the upload finishes.
         """
-        data = request.data.copy()
-
-        image_url = data.get("image_url")
-        # If image_url is provided (and no file was uploaded), try to upload it to Cloudinary
-        temp_public_id = None
+        image_url = request.data.get("image_url")
         if image_url:
-            if not _CLOUDINARY_AVAILABLE:
-                return Response(
-                    {"image_url": "Cloudinary not configured on server. Provide a file upload instead."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            try:
-                temp_public_id = self._upload_remote_to_cloudinary(image_url)
-            except Exception as exc:
-                return Response({"image_url": f"Failed to upload remote image: {str(exc)}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Remove image_url so serializer (which expects ImageField) doesn't choke
-        if "image_url" in data:
-            data.pop("image_url")
+            error = _image_url_error(image_url)
+            if error:
+                return Response({"image_url": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = self.get_serializer(data=data)
+        serializer = self.get_serializer(data=_without_image_url(request.data))
         serializer.is_valid(raise_exception=True)
-        instance = serializer.save()
+        if image_url:
+            instance = serializer.save(image_status=IMAGE_PENDING, image_source_url=image_url)
+        else:
+            instance = serializer.save()
 
-        # if we uploaded to Cloudinary, set the CloudinaryField value to the public_id
-        if temp_public_id:
-            # assign public_id (CloudinaryField stores public_id as the model value)
-            instance.image = temp_public_id
-            instance.save(update_fields=["image"])
+        # fetching the remote image can take seconds, don't hold the request for it
+        if image_url:
+            enqueue_remote_image_upload(instance.pk, image_url)
 
         # Return detail serializer so front-end receives image_url & top_level_comments etc.
+        # (re-read with counts annotated)
+        instance = self.get_queryset().get(pk=instance.pk)
         out_serializer = PostDetailSerializer(instance, context=self.get_serializer_context())
         return Response(out_serializer.data, status=status.HTTP_201_CREATED)
 
@@ -129,32 +162,28 @@ class PostViewSet(viewsets.ModelViewSet):
         """
         partial = kwargs.pop("partial", False)
         instance = self.get_object()
-        data = request.data.copy()
-
-        image_url = data.get("image_url")
+        image_url = request.data.get("image_url")
         temp_public_id = None
         if image_url:
-            if not _CLOUDINARY_AVAILABLE:
-                return Response(
-                    {"image_url": "Cloudinary not configured on server. Provide a file upload instead."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            error = _image_url_error(image_url)
+            if error:
+                return Response({"image_url": error}, status=status.HTTP_400_BAD_REQUEST)
             try:
-                temp_public_id = self._upload_remote_to_cloudinary(image_url)
+                temp_public_id = upload_remote_to_cloudinary(image_url)
             except Exception as exc:
                 return Response({"image_url": f"Failed to upload remote image: {str(exc)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if "image_url" in data:
-            data.pop("image_url")
-
-        serializer = self.get_serializer(instance, data=data, partial=partial)
+        serializer = self.get_serializer(instance, data=_without_image_url(request.data), partial=partial)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
 
         if temp_public_id:
             instance.image = temp_public_id
-            instance.save(update_fields=["image"])
+            instance.image_status = ""
+            instance.image_source_url = ""
+            instance.save(update_fields=["image", "image_status", "image_source_url"])
 
+        instance = self.get_queryset().get(pk=instance.pk)
         out_serializer = PostDetailSerializer(instance, context=self.get_serializer_context())
         return Response(out_serializer.data, status=status.HTTP_200_OK)
 
@@ -162,10 +191,9 @@ class PostViewSet(viewsets.ModelViewSet):
     def comments(self, request, slug=None):
         post = self.get_object()
         if request.method == "GET":
-            # top-level comments returned (replies nested by serializer)
-            comments_qs = post.comments.filter(parent__isnull=True, is_active=True).order_by("created_at")
-            serializer = CommentSerializer(comments_qs, many=True, context=self.get_serializer_context())
-            return Response(serializer.data)
+            # top-level comments returned (replies nested from a single query)
+            comments = post.comments.filter(is_active=True).order_by("created_at")
+            return Response(serialize_comment_tree(comments))
 
         # POST: create comment (or reply if parent provided)
         serializer = CommentSerializer(data=request.data, context=self.get_serializer_context())
@@ -173,6 +201,9 @@ class PostViewSet(viewsets.ModelViewSet):
             parent = serializer.validated_data.get("parent")
             if parent is not None and parent.post_id != post.id:
                 return Response({"parent": "Parent comment does not belong to this post."}, status=status.HTTP_400_BAD_REQUEST)
+            # replies below MAX_REPLY_DEPTH would never be serialized, refuse them
+            if parent is not None and _comment_depth(parent) >= MAX_REPLY_DEPTH:
+                return Response({"parent": "Replies can't be nested this deep."}, status=status.HTTP_400_BAD_REQUEST)
             serializer.save(post=post)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -180,13 +211,18 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["POST"], url_path="like")
     def like(self, request, slug=None):
         post = self.get_object()
-        visitor_id = request.data.get("visitor_id") or request.META.get("REMOTE_ADDR") or str(post.id)
-        like_qs = Like.objects.filter(post=post, visitor_id=visitor_id)
-        if like_qs.exists():
-            like_qs.delete()
-            likes_count = post.likes.count()
-            return Response({"likes_count": likes_count, "liked": False})
-        else:
-            Like.objects.create(post=post, visitor_id=visitor_id)
-            likes_count = post.likes.count()
-            return Response({"likes_count": likes_count, "liked": True})
+        visitor_id = normalize_visitor_id(request.data.get("visitor_id") or request.META.get("REMOTE_ADDR") or post.id)
+        # post comes annotated with likes_count, so adjust it instead of recounting.
+        # Delete first: one statement decides unlike, and the unique constraint
+        # settles a concurrent double like without a read-then-write race.
+        deleted, _ = Like.objects.filter(post=post, visitor_id=visitor_id).delete()
+        if deleted:
+            return Response({"likes_count": post.likes_count - 1, "liked": False})
+        try:
+            with transaction.atomic():
+                Like.objects.create(post=post, visitor_id=visitor_id)
+        except IntegrityError:
+            # a parallel request liked it first; either way the like exists now and
+            # wasn't there when likes_count was annotated
+            return Response({"likes_count": post.likes_count + 1, "liked": True})
+        return Response({"likes_count": post.likes_count + 1, "liked": True})
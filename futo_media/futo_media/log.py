@@ -0,0 +1,77 @@
+# futo_media/log.py
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# orjson is optional; fall back to the stdlib encoder without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger and message, plus the
+    formatted traceback under "exc_info" when the record carries one.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        if orjson is not None:
+            return orjson.dumps(entry).decode()
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to a queue; a listener thread formats them as JSON and writes
+    them to stderr, so logging callers never wait on the stream.
+    The listener is started lazily by the first record logged in each process,
+    which keeps it alive across gunicorn's fork of preloaded workers.
+    """
+
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            stream = logging.StreamHandler()
+            stream.setFormatter(JSONFormatter())
+            listener = QueueListener(self.queue, stream)
+            listener.start()
+            # drain what's queued before the interpreter exits
+            atexit.register(listener.stop)
+            self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # merge the args now, they may change before the listener gets to the record;
+        # unlike QueueHandler.prepare keep exc_info (the queue never leaves the process)
+        # so JSONFormatter can put the traceback in its own field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        super().emit(record)
@@ -1,23 +1,44 @@
 # futo_media/settings.py
 import os
 from pathlib import Path
-import dj_database_url
-from dotenv import load_dotenv
-
-# Load .env (local dev). In production Render / other platform will supply env vars.
-load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+# plain-string form for the path settings below, which Django only uses as strings
+_BASE = str(BASE_DIR)
+
+_TRUE = frozenset(("true", "1", "yes", "on", "y", "t"))
+
+
+def _envbool(key, default="False"):
+    """Boolean flag from the environment (any of _TRUE, case-insensitive)."""
+    return os.getenv(key, default).lower() in _TRUE
+
+
+def _csv(key, default=()):
+    """Comma separated list from the environment, `default` when it has no items."""
+    value = os.getenv(key)
+    # strip() rather than dropping spaces: multi-line values also carry tabs and newlines
+    items = [item.strip() for item in value.split(",") if item.strip()] if value else None
+    return items or list(default)
+
+
+# Load .env (local dev). In production Render / other platform will supply env vars,
+# so skip it there (Render sets RENDER) and otherwise only import dotenv when there
+# is a file to read (no search up the tree). DJANGO_LOAD_DOTENV=0 turns it off.
+_DOTENV_PATH = BASE_DIR / ".env"
+if not os.getenv("RENDER") and _envbool("DJANGO_LOAD_DOTENV", "1") and _DOTENV_PATH.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_DOTENV_PATH)
 
 # -----------------------
 # Basic / Security
 # -----------------------
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
-DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
+DEBUG = _envbool("DEBUG")
 
 # ALLOWED_HOSTS read from env (comma separated). Render sets RENDER_EXTERNAL_HOSTNAME
-raw_allowed = os.getenv("ALLOWED_HOSTS", "")
-ALLOWED_HOSTS = [h.strip() for h in raw_allowed.split(",") if h.strip()]
+ALLOWED_HOSTS = _csv("ALLOWED_HOSTS")
 render_host = os.getenv("RENDER_EXTERNAL_HOSTNAME")
 if render_host and render_host not in ALLOWED_HOSTS:
     ALLOWED_HOSTS.append(render_host)
@@ -27,7 +48,7 @@ if not ALLOWED_HOSTS:
 # -----------------------
 # Installed apps & middleware
 # -----------------------
-INSTALLED_APPS = [
+INSTALLED_APPS = (
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -37,18 +58,12 @@ INSTALLED_APPS = [
 
     # Third-party
     "rest_framework",
-    "corsheaders",
-
-    # Cloudinary storage
-    "cloudinary",
-    "cloudinary_storage",
 
     # Local
     "blog",
-]
+)
 
-MIDDLEWARE = [
-    "corsheaders.middleware.CorsMiddleware",  # must be early
+MIDDLEWARE = (
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # serve static files on Render
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -57,7 +72,28 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-]
+)
+
+# API_ONLY=1 serves just the JSON API: the admin and the session / messages stack it
+# needs are left out of the apps and the middleware chain
+API_ONLY = _envbool("API_ONLY")
+ENABLE_ADMIN = not API_ONLY
+if API_ONLY:
+    _ADMIN_APPS = ("django.contrib.admin", "django.contrib.sessions", "django.contrib.messages")
+    _ADMIN_MIDDLEWARE = (
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+    )
+    INSTALLED_APPS = tuple(app for app in INSTALLED_APPS if app not in _ADMIN_APPS)
+    MIDDLEWARE = tuple(m for m in MIDDLEWARE if m not in _ADMIN_MIDDLEWARE)
+
+# CORS can be answered at the edge (CDN / proxy) instead; CORS_IN_DJANGO=0 keeps
+# corsheaders out of the app registry and the per-request middleware chain
+CORS_IN_DJANGO = _envbool("CORS_IN_DJANGO", "1")
+if CORS_IN_DJANGO:
+    INSTALLED_APPS += ("corsheaders",)
+    MIDDLEWARE = ("corsheaders.middleware.CorsMiddleware",) + MIDDLEWARE  # must be early
 
 ROOT_URLCONF = "futo_media.urls"
 
@@ -67,15 +103,18 @@ TEMPLATES = [
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
-            "context_processors": [
+            "context_processors": (
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-            ]
+            )
         },
     }
 ]
+# only the admin and DRF's browsable API render templates; API_ONLY has neither
+if not ENABLE_ADMIN:
+    TEMPLATES = []
 
 WSGI_APPLICATION = "futo_media.wsgi.application"
 ASGI_APPLICATION = "futo_media.asgi.application"
@@ -85,34 +124,46 @@ ASGI_APPLICATION = "futo_media.asgi.application"
 # -----------------------
 DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL:
-    DATABASES = {"default": dj_database_url.parse(DATABASE_URL, conn_max_age=600)}
+    import dj_database_url
+
+    # persistent connections are checked before reuse, so a connection the server
+    # dropped while idle is replaced up front instead of failing the request.
+    # Options such as ?sslmode=require are taken from the URL.
+    DATABASES = {"default": dj_database_url.parse(DATABASE_URL, conn_max_age=600, conn_health_checks=True)}
 else:
-    DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
+    DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(_BASE, "db.sqlite3")}}
 
 # -----------------------
 # Password validators
 # -----------------------
-AUTH_PASSWORD_VALIDATORS = [
+AUTH_PASSWORD_VALIDATORS = (
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
     {"NAME": "django.contrib.auth.password_validation.CommonPasswordValidator"},
     {"NAME": "django.contrib.auth.password_validation.NumericPasswordValidator"},
-]
+)
 
 # -----------------------
 # Internationalization
 # -----------------------
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "Africa/Lagos"
-USE_I18N = True
+# everything (API messages and admin) is served in LANGUAGE_CODE only; skip the
+# translation catalogs
+USE_I18N = False
 USE_TZ = True
 
 # -----------------------
 # Static files (WhiteNoise)
 # -----------------------
 STATIC_URL = "/static/"
-STATIC_ROOT = BASE_DIR / "staticfiles"
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+STATIC_ROOT = os.path.join(_BASE, "staticfiles")
+# hashed filenames only matter for the admin's CSS/JS here; opt in with STATIC_MANIFEST=1
+# (production only) to pay for the manifest, otherwise just serve compressed files
+if not DEBUG and _envbool("STATIC_MANIFEST"):
+    STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+else:
+    STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 
 # -----------------------
 # Cloudinary / Media
@@ -124,15 +175,8 @@ CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 USE_CLOUDINARY = bool(CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET)
 
 if USE_CLOUDINARY:
-    import cloudinary
-
-    cloudinary.config(
-        cloud_name=CLOUDINARY_CLOUD_NAME,
-        api_key=CLOUDINARY_API_KEY,
-        api_secret=CLOUDINARY_API_SECRET,
-        secure=True,
-    )
-    DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
+    # the SDK itself is configured from these settings by futo_media.storages.configure_cloudinary
+    INSTALLED_APPS += ("cloudinary", "cloudinary_storage")
 
     # You may put global storage options here if desired
     CLOUDINARY_STORAGE = {
@@ -141,22 +185,23 @@ if USE_CLOUDINARY:
         "API_SECRET": CLOUDINARY_API_SECRET,
         # other options possible (e.g. 'FOLDER') but we explicitly set folder per-field in model
     }
-else:
-    DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
+
+# Django 5.1+ only reads STORAGES (DEFAULT_FILE_STORAGE/STATICFILES_STORAGE are ignored).
+# The media storage decides between Cloudinary and the local disk on first use.
+STORAGES = {
+    "default": {"BACKEND": "futo_media.storages.ConfiguredMediaStorage"},
+    "staticfiles": {"BACKEND": STATICFILES_STORAGE},
+}
 
 MEDIA_URL = "/media/"
-MEDIA_ROOT = BASE_DIR / "media"
+MEDIA_ROOT = os.path.join(_BASE, "media")
 
 # -----------------------
 # CORS / CSRF
 # -----------------------
-raw_cors = os.getenv("CORS_ALLOWED_ORIGINS", "")
-CORS_ALLOWED_ORIGINS = [u.strip() for u in raw_cors.split(",") if u.strip()]
-if not CORS_ALLOWED_ORIGINS:
-    CORS_ALLOWED_ORIGINS = ["http://localhost:5173", "http://127.0.0.1:5173"]
+CORS_ALLOWED_ORIGINS = _csv("CORS_ALLOWED_ORIGINS", ("http://localhost:5173", "http://127.0.0.1:5173"))
 
-raw_csrf = os.getenv("CSRF_TRUSTED_ORIGINS", "")
-CSRF_TRUSTED_ORIGINS = [u.strip() for u in raw_csrf.split(",") if u.strip()]
+CSRF_TRUSTED_ORIGINS = _csv("CSRF_TRUSTED_ORIGINS")
 frontend_origin = os.getenv("VITE_API_CLIENT_ORIGIN")
 if frontend_origin and frontend_origin not in CSRF_TRUSTED_ORIGINS:
     CSRF_TRUSTED_ORIGINS.append(frontend_origin)
@@ -164,7 +209,18 @@ if frontend_origin and frontend_origin not in CSRF_TRUSTED_ORIGINS:
 # -----------------------
 # REST Framework
 # -----------------------
-REST_FRAMEWORK = {"DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"]}
+REST_FRAMEWORK = {
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
+    # the API is open and nothing reads request.user, so don't authenticate at all
+    "DEFAULT_AUTHENTICATION_CLASSES": [],
+    "UNAUTHENTICATED_USER": None,
+    "DEFAULT_RENDERER_CLASSES": ["blog.renderers.ORJSONRenderer"],
+    # PostViewSet adds the multipart / form parsers it needs for image uploads
+    "DEFAULT_PARSER_CLASSES": ["rest_framework.parsers.JSONParser"],
+}
+if DEBUG and ENABLE_ADMIN:
+    # browsable API for local development (needs the template stack API_ONLY drops)
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append("rest_framework.renderers.BrowsableAPIRenderer")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -172,16 +228,15 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Proxy / HTTPS (for render)
 # -----------------------
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
-if os.getenv("SECURE_SSL_REDIRECT", "False").lower() in ("true", "1", "yes"):
+if _envbool("SECURE_SSL_REDIRECT"):
     SECURE_SSL_REDIRECT = True
 
 # -----------------------
-# Logging (console)
+# Logging (console, JSON lines written off the request thread; see futo_media/log.py)
 # -----------------------
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "formatters": {"simple": {"format": "%(levelname)s %(message)s"}},
-    "handlers": {"console": {"class": "logging.StreamHandler", "formatter": "simple"}},
+    "handlers": {"console": {"()": "futo_media.log.BackgroundHandler"}},
     "root": {"handlers": ["console"], "level": os.getenv("DJANGO_LOG_LEVEL", "INFO")},
 }
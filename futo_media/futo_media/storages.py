@@ -0,0 +1,40 @@
+# futo_media/storages.py
+import functools
+
+from django.conf import settings
+from django.utils.functional import LazyObject
+
+
+@functools.cache
+def configure_cloudinary():
+    """
+    Applies the Cloudinary credentials from settings to the SDK, once per process.
+    """
+    import cloudinary
+
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET,
+        secure=True,
+    )
+
+
+class ConfiguredMediaStorage(LazyObject):
+    """
+    Media storage picked on first use: MediaCloudinaryStorage when Cloudinary
+    credentials are configured, FileSystemStorage (MEDIA_ROOT) otherwise.
+    cloudinary_storage (and its requests / admin API dependencies) is only
+    imported when it is actually the one used.
+    """
+
+    def _setup(self):
+        if settings.USE_CLOUDINARY:
+            configure_cloudinary()
+            from cloudinary_storage.storage import MediaCloudinaryStorage
+
+            self._wrapped = MediaCloudinaryStorage()
+        else:
+            from django.core.files.storage import FileSystemStorage
+
+            self._wrapped = FileSystemStorage()
@@ -1,19 +1,20 @@
 # futo_media/urls.py
-from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from rest_framework import routers
-from blog.views import PostViewSet
-
-router = routers.DefaultRouter()
-router.register(r"posts", PostViewSet, basename="post")
 
+# the API routes (and the DRF / blog.views imports behind them) live in blog.urls
 urlpatterns = [
-    path("admin/", admin.site.urls),
-    path("api/", include(router.urls)),
+    path("api/", include("blog.urls")),
 ]
 
-# Serve media files in DEBUG for local dev
-if settings.DEBUG:
+# import the admin only when it is mounted (see API_ONLY in settings)
+if settings.ENABLE_ADMIN:
+    from django.contrib import admin
+
+    urlpatterns += [path("admin/", admin.site.urls)]
+
+# Serve media files in DEBUG for local dev (only when they live on the local disk;
+# Cloudinary media is served from its CDN)
+if settings.DEBUG and not settings.USE_CLOUDINARY:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)